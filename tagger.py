@@ -1,11 +1,39 @@
 #!/usr/bin/env python3
 import os
 import sys
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import math
+import re
+import sqlite3
+import time
+import httpx
+import orjson
 import requests
 import csv
-from urllib.parse import urljoin
-from openai import OpenAI
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError
+)
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+from typing import List, Dict, Iterator, Mapping, Optional
 
 """
 WordPress Image Alt Text Generator
@@ -16,24 +44,264 @@ It can operate in dry-run mode (default) or update mode.
 
 """
 
-def display_usage():
-    """Display script usage information."""
-    print("""
-Usage: python tagger.py <wordpress_url> [options]
+CACHE_FILE = ".alt_cache.sqlite"
+ETAG_FILE = ".wp_etags.json"
+PAGE_CACHE_DIR = ".wp_pages"
+BATCH_MAX_REQUESTS = 50000  # Batch API limits per input file
+BATCH_MAX_BYTES = 190 * 1024 * 1024  # 200 MB limit, with headroom
+BATCH_MAX_TOKENS = 2000000  # Enqueued token limit (lowest usage tier)
+BATCH_EST_TOKENS = 200  # Estimated tokens per low-detail alt text request
+BATCH_FILE = ".openai_batches.json"
+CSV_FIELDNAMES = ["id", "title", "original_alt", "generated_alt", "url"]
+COMPRESSION_MIN_BYTES = 8 * 1024  # Smaller pages may legitimately be sent uncompressed
+CHECKPOINT_ROWS = 20  # Flush the CSV and cache every N rows
+VISION_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
 
-Required:
-    wordpress_url : The base URL of the WordPress site
+SYSTEM_PROMPT = (
+    "You are an expert at writing descriptive, concise alt text for images. "
+    "Provide only the alt text, without any additional explanation or context."
+    "If the image is decorative, return 'Decorative image ' with a brief description of the image."
+    "Be concise. You don't need to write complete sentences. The output should be a single line of text."
+)
 
-Options:
-    -m, --model  : OpenAI model to use (default: gpt-4o-mini)
-    -w, --write  : Enable write mode (default: dry-run if omitted)
-    -l, --limit  : Number of images to process (default: 10, 0 for all)
-    -o, --output : Output CSV file (default: domain_name.csv)
+# Prompt parts shared by every request; only the image part is built per call
+SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+USER_TEXT = {"type": "text", "text": "Please write appropriate alt text for this image:"}
 
-Example:
-    python tagger.py https://example.com -m gpt-4 -w -l 20 -o results.csv
-    """)
-    sys.exit(1)
+# Group mode answers with JSON instead of a single line of alt text
+GROUP_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are an expert at writing descriptive, concise alt text for images. "
+               "You will be given several images, each preceded by its numeric image ID. "
+               "Respond with a single JSON object whose keys are the numeric image IDs as strings, "
+               "exactly as given and with no other text, and whose values are the alt text for that image, "
+               "for example {\"123\": \"Red bicycle leaning against a brick wall\"}. "
+               "Include every image ID. "
+               "If an image is decorative, use 'Decorative image ' with a brief description of the image. "
+               "Be concise. You don't need to write complete sentences. Each alt text should be a single line."
+}
+
+# Shared HTTP session so WordPress requests reuse keep-alive connections
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False  # Hand the final error response back to the caller
+    )
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({
+    "User-Agent": "alt-tagger/1.0",
+    # gzip/deflate, plus br when the brotli package is installed
+    "Accept-Encoding": ACCEPT_ENCODING
+})
+
+class RateLimiter:
+    """
+    Client-side sliding-window limiter for OpenAI request and token quotas.
+    
+    Requests wait in acquire() until both the per-minute request and token
+    budgets have room. The budgets and any server-imposed pause are kept in
+    sync with the x-ratelimit-* and retry-after response headers.
+    """
+    
+    WINDOW = 60.0
+    
+    def __init__(self, rpm: int = 500, tpm: int = 200000):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = deque()  # (timestamp, 1)
+        self.tokens = deque()  # (timestamp, token cost)
+        self.token_total = 0
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _prune(self, now: float):
+        """Drop window entries older than one minute."""
+        while self.requests and now - self.requests[0][0] >= self.WINDOW:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= self.WINDOW:
+            self.token_total -= self.tokens.popleft()[1]
+    
+    async def acquire(self, est_tokens: int = 200):
+        """Wait until a request costing est_tokens fits in both budgets."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self.blocked_until - now
+                if len(self.requests) >= self.rpm:
+                    wait = max(wait, self.requests[0][0] + self.WINDOW - now)
+                if self.tokens and self.token_total + est_tokens > self.tpm:
+                    wait = max(wait, self.tokens[0][0] + self.WINDOW - now)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.append((now, 1))
+            self.tokens.append((now, est_tokens))
+            self.token_total += est_tokens
+    
+    def block_for(self, seconds: float):
+        """Pause all callers for at least the given number of seconds."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    def update(self, headers: Mapping[str, str]):
+        """Sync limits and pauses with OpenAI's rate limit headers."""
+        for kind in ("requests", "tokens"):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if limit and limit.isdigit():
+                setattr(self, "rpm" if kind == "requests" else "tpm", int(limit))
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining == "0":
+                reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.block_for(reset)
+        retry_after = parse_retry_after(headers)
+        if retry_after:
+            self.block_for(retry_after)
+
+def parse_reset_duration(value: Optional[str]) -> float:
+    """
+    Parse an OpenAI reset duration such as '20ms', '1s' or '6m0s'.
+    
+    Returns:
+        Duration in seconds (0 if missing or unparseable)
+    """
+    if not value:
+        return 0.0
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+def parse_retry_after(headers: Mapping[str, str]) -> float:
+    """
+    Read the retry-after-ms / retry-after headers.
+    
+    Returns:
+        Delay in seconds (0 if missing or unparseable)
+    """
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return 0.0
+
+def open_cache(path: str = CACHE_FILE) -> sqlite3.Connection:
+    """
+    Open (and create if needed) the on-disk alt text cache.
+    
+    Args:
+        path: SQLite database file
+        
+    Returns:
+        Open SQLite connection
+    """
+    cache = sqlite3.connect(path)
+    cache.execute(
+        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, alt TEXT, ts INTEGER)"
+    )
+    return cache
+
+def cache_key(model: str, image_url: str) -> str:
+    """Build the cache key for an image/model pair."""
+    return hashlib.sha256(f"{model}|{image_url}".encode()).hexdigest()
+
+def cache_get(cache: sqlite3.Connection, model: str, image_url: str) -> Optional[str]:
+    """Return cached alt text for an image, or None on a miss."""
+    row = cache.execute(
+        "SELECT alt FROM cache WHERE key = ?", (cache_key(model, image_url),)
+    ).fetchone()
+    return row[0] if row else None
+
+def cache_put(cache: sqlite3.Connection, model: str, image_url: str, alt_text: str):
+    """Store generated alt text (committed by the caller)."""
+    cache.execute(
+        "INSERT OR REPLACE INTO cache (key, alt, ts) VALUES (?, ?, ?)",
+        (cache_key(model, image_url), alt_text, int(time.time()))
+    )
+
+def load_previous_rows(output_file: str) -> List[List[str]]:
+    """
+    Read the rows a previous run wrote alt text for.
+    
+    Rows with an empty generated_alt (failed generations or URL checks),
+    rows that don't parse and a partially written last line are dropped, so
+    those images are retried and the file can be rewritten cleanly.
+    
+    Args:
+        output_file: CSV written by an earlier run
+        
+    Returns:
+        Rows in CSV_FIELDNAMES order
+    """
+    if not os.path.exists(output_file):
+        return []
+    with open(output_file, newline="", encoding="utf-8") as f:
+        content = f.read()
+    rows = list(csv.reader(io.StringIO(content, newline="")))
+    if not rows:
+        return []
+    if rows[0] != CSV_FIELDNAMES:
+        print(f"Error: {output_file} is not an alt text results file; choose another with -o/--output")
+        sys.exit(1)
+    
+    body = rows[1:]
+    if body and not content.endswith("\n"):
+        body.pop()  # Interrupted mid-write
+    
+    kept = []
+    for row in body:
+        if len(row) != len(CSV_FIELDNAMES) or not row[3]:
+            continue
+        try:
+            int(row[0])
+        except ValueError:
+            continue
+        kept.append(row)
+    return kept
+
+def load_pending_batches(path: str = BATCH_FILE) -> List[Dict]:
+    """Load the batch jobs a previous run submitted but did not collect."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def save_pending_batches(jobs: List[Dict], path: str = BATCH_FILE):
+    """Persist submitted batch jobs until their results are cached."""
+    if not jobs:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(jobs, f, indent=2)
+
+def load_etags(path: str = ETAG_FILE) -> Dict[str, str]:
+    """Load saved WordPress page ETags (empty if none saved yet)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_etags(etags: Dict[str, str], path: str = ETAG_FILE):
+    """Persist WordPress page ETags for the next run."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(etags, f, indent=2, sort_keys=True)
+
+def page_cache_key(api_url: str, params: Dict) -> str:
+    """Build the ETag/page cache key for one WordPress API request."""
+    query = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return hashlib.sha256(f"{api_url}?{query}".encode()).hexdigest()
 
 def validate_arguments(args: List[str]) -> tuple:
     """
@@ -43,208 +311,782 @@ def validate_arguments(args: List[str]) -> tuple:
         args: List of command line arguments
         
     Returns:
-        tuple: (wordpress_url, model, write_mode, limit, output_file)
-    """
-    if len(args) < 2:
-        display_usage()
-    
-    # Initialize defaults
-    wordpress_url = args[1]
-    model = "gpt-4o-mini"
-    write_mode = False
-    limit = 10
-    output_file = None
-    
-    # Process arguments
-    i = 2
-    while i < len(args):
-        if args[i] in ['-m', '--model']:
-            if i + 1 < len(args):
-                model = args[i + 1]
-                i += 2
-            else:
-                print("Error: Model name missing after -m/--model")
-                sys.exit(1)
-        elif args[i] in ['-l', '--limit']:
-            if i + 1 < len(args):
-                try:
-                    limit = int(args[i + 1])
-                    i += 2
-                except ValueError:
-                    print("Error: Limit must be a number")
-                    sys.exit(1)
-            else:
-                print("Error: Limit value missing after -l/--limit")
-                sys.exit(1)
-        elif args[i] in ['-o', '--output']:
-            if i + 1 < len(args):
-                output_file = args[i + 1]
-                i += 2
-            else:
-                print("Error: Output file name missing after -o/--output")
-                sys.exit(1)
-        elif args[i] in ['-w', '--write']:
-            write_mode = True
-            i += 1
-        else:
-            print(f"Error: Unknown argument '{args[i]}'")
-            display_usage()
+        tuple: (wordpress_url, model, write_mode, limit, output_file, concurrency,
+                batch_mode, group_size)
+    """
+    parser = argparse.ArgumentParser(
+        prog="tagger.py",
+        description="Generate alt text for WordPress images missing it using OpenAI's Vision API.",
+        epilog="Example: python tagger.py https://example.com -m gpt-4 -w -l 20 -o results.csv"
+    )
+    parser.add_argument("wordpress_url", help="The base URL of the WordPress site")
+    parser.add_argument("-m", "--model", default="gpt-4o-mini",
+                        help="OpenAI model to use (default: gpt-4o-mini)")
+    parser.add_argument("-w", "--write", action="store_true",
+                        help="Enable write mode (default: dry-run if omitted)")
+    parser.add_argument("-l", "--limit", type=int, default=10,
+                        help="Number of images to process (default: 10, 0 for all)")
+    parser.add_argument("-o", "--output",
+                        help="Output CSV file (default: domain_name.csv)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8,
+                        help="Maximum concurrent OpenAI requests (default: 8)")
+    parser.add_argument("-b", "--batch", action="store_true",
+                        help="Use the OpenAI Batch API (cheaper, may take up to 24h)")
+    parser.add_argument("-g", "--group-size", type=int, default=1,
+                        help="Images described per OpenAI request (default: 1, "
+                             "not available with --batch)")
+    parsed = parser.parse_args(args[1:])
+    
+    if parsed.concurrency < 1:
+        parser.error("concurrency must be at least 1")
+    if parsed.group_size < 1:
+        parser.error("group size must be at least 1")
+    if parsed.batch and parsed.group_size > 1:
+        parser.error("--group-size cannot be combined with --batch")
     
     # Generate default output filename from domain if not specified
+    output_file = parsed.output
     if not output_file:
-        from urllib.parse import urlparse
-        domain = urlparse(wordpress_url).netloc
+        domain = urlparse(parsed.wordpress_url).netloc
         output_file = f"{domain}.csv"
     
     # Ensure .csv extension
     if not output_file.lower().endswith('.csv'):
         output_file += '.csv'
         
-    return wordpress_url, model, write_mode, limit, output_file
+    return (parsed.wordpress_url, parsed.model, parsed.write, parsed.limit, output_file,
+            parsed.concurrency, parsed.batch, parsed.group_size)
 
-def get_wordpress_media(base_url: str, limit: int) -> List[Dict]:
+def iter_wordpress_media(base_url: str, limit: int) -> Iterator[Dict]:
     """
-    Retrieve media items from WordPress API with pagination support.
+    Stream image media items from WordPress API with pagination support.
+    
+    Pages are fetched a few at a time and yielded item by item, so only
+    the pages currently in flight are held in memory.
     
     Args:
         base_url: WordPress site URL
         limit: Maximum number of items to retrieve (0 for all)
         
-    Returns:
-        List of media items
+    Yields:
+        Image media items
     """
     api_url = urljoin(base_url, "wp-json/wp/v2/media")
-    media_items = []
-    page = 1
-    per_page = 100  # Maximum allowed by WordPress
-    
-    while True:
-        params = {
-            "page": page,
-            "per_page": per_page
-        }
+    base_params = {
+        "media_type": "image",  # Let WordPress skip non-image attachments
+        # Only what we read (nested _fields needs WordPress 5.3+)
+        "_fields": "id,title,alt_text,media_type,source_url,media_details.sizes.medium.source_url"
+    }
+    
+    # Probe the collection size so we know exactly which pages to fetch
+    try:
+        response = SESSION.get(
+            api_url,
+            params={**base_params, "per_page": 1, "_fields": "id"},
+            timeout=30
+        )
+    except requests.RequestException as e:
+        print(f"Error fetching media items: {e}")
+        return
+    if response.status_code != 200:
+        print(f"Error fetching media items: {response.status_code}")
+        return
+    
+    total = response.headers.get("X-WP-Total", "").strip()
+    if total.isdigit():
+        wanted = min(limit, int(total)) if limit > 0 else int(total)
+        if wanted == 0:
+            return
+        per_page = min(wanted, 100)  # 100 is the maximum allowed by WordPress
+        pages_needed = math.ceil(wanted / per_page)
+    else:
+        # Some proxies and security plugins strip X-WP-*; page until we run out
+        print("Warning: X-WP-Total header missing, fetching pages until an empty one")
+        wanted = limit if limit > 0 else None
+        per_page = min(limit, 100) if limit > 0 else 100
+        pages_needed = None
+    
+    etags = load_etags()
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    
+    def fetch_page(page: int) -> List[Dict]:
+        params = {**base_params, "page": page, "per_page": per_page}
+        key = page_cache_key(api_url, params)
+        page_file = os.path.join(PAGE_CACHE_DIR, f"{key}.json")
+        
+        # Revalidate pages we have a stored copy of
+        headers = {}
+        if key in etags and os.path.exists(page_file):
+            headers["If-None-Match"] = etags[key]
+        
+        try:
+            response = SESSION.get(api_url, params=params, headers=headers, timeout=30)
+        except requests.RequestException as e:
+            print(f"Error fetching media page {page}: {e}")
+            return []
+        
+        if response.status_code == 304:
+            with open(page_file, "rb") as f:
+                return orjson.loads(f.read())
         
-        response = requests.get(api_url, params=params)
+        if response.status_code == 400 and pages_needed is None and page > 1:
+            return []  # Past the last page
         
         if response.status_code != 200:
-            print(f"Error fetching media items: {response.status_code}")
-            break
-            
-        items = response.json()
-        if not items:
-            break
+            print(f"Error fetching media page {page}: {response.status_code}")
+            return []
             
-        media_items.extend(items)
+        # Servers skip compressing small bodies, so only judge a sizeable page
+        if (page == 1 and len(response.content) >= COMPRESSION_MIN_BYTES
+                and not response.headers.get("Content-Encoding")):
+            print("Warning: WordPress responses are not compressed; "
+                  "enabling gzip or brotli on the web server would speed up fetching")
         
-        # Check if we've reached the limit
-        if limit > 0 and len(media_items) >= limit:
-            media_items = media_items[:limit]
-            break
-            
-        page += 1
+        items = orjson.loads(response.content)
+        etag = response.headers.get("ETag")
+        if etag:
+            # Store the body as received; it is already valid JSON
+            with open(page_file, "wb") as f:
+                f.write(response.content)
+            etags[key] = etag
+        return items
+    
+    # Pages are independent, so fetch them in parallel over the pooled session,
+    # one window of workers at a time; map() keeps them in page order.
+    # Without a known page count, fetch one page at a time until a short one.
+    workers = min(8, pages_needed) if pages_needed else 1
+    count = 0
+    start = 1
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pages_needed is None or start <= pages_needed:
+                end = start + workers
+                if pages_needed is not None:
+                    end = min(end, pages_needed + 1)
+                for items in executor.map(fetch_page, range(start, end)):
+                    for item in items:
+                        yield item
+                        count += 1
+                        if wanted is not None and count >= wanted:
+                            return
+                    if pages_needed is None and len(items) < per_page:
+                        return
+                start = end
+    finally:
+        save_etags(etags)
+
+def build_messages(image_url: str) -> List[Dict]:
+    """
+    Build the chat messages asking for alt text for one image.
     
-    return media_items
+    Args:
+        image_url: URL of the image
+        
+    Returns:
+        Chat completion messages
+    """
+    return [
+        SYSTEM_MSG,
+        {
+            "role": "user",
+            "content": [
+                USER_TEXT,
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url,
+                        "detail": "low",
+                    },
+                },
+            ],
+        }
+    ]
 
-def generate_alt_text(client: OpenAI, image_url: str, model: str) -> str:
+def build_group_messages(items: List[Dict]) -> List[Dict]:
+    """
+    Build the chat messages asking for alt text for several images at once.
+    
+    Args:
+        items: WordPress media items
+        
+    Returns:
+        Chat completion messages
+    """
+    content = [{
+        "type": "text",
+        "text": "Please write appropriate alt text for each image below. "
+                "Return a JSON object mapping each numeric image ID to its alt text."
+    }]
+    for item in items:
+        content.append({"type": "text", "text": f"Image ID {item['id']}:"})
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": vision_image_url(item),
+                "detail": "low",
+            },
+        })
+    return [
+        GROUP_SYSTEM_MSG,
+        {"role": "user", "content": content}
+    ]
+
+def vision_image_url(item: Dict) -> str:
+    """
+    Pick the image URL to send to the Vision API.
+    
+    The low-detail vision model never sees more than 512px, so WordPress's
+    "medium" rendition is used when it exists instead of the full upload.
+    
+    Args:
+        item: WordPress media item
+        
+    Returns:
+        URL of the medium size, or the original source URL
+    """
+    sizes = (item.get("media_details") or {}).get("sizes") or {}
+    return (sizes.get("medium") or {}).get("source_url") or item["source_url"]
+
+def is_valid_image(url: str) -> bool:
+    """
+    Check that an image URL resolves to a format the Vision API accepts.
+    
+    Args:
+        url: URL of the image
+        
+    Returns:
+        True if the URL answers 200 with a supported image content type
+    """
+    try:
+        response = SESSION.head(url, allow_redirects=True, timeout=5)
+        if response.status_code in (405, 501):
+            # Some hosts refuse HEAD; fall back to a GET without reading the body
+            response = SESSION.get(url, allow_redirects=True, timeout=5, stream=True)
+            response.close()
+    except requests.RequestException as e:
+        print(f"Skipping {url}: {e}")
+        return False
+    
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if response.status_code != 200 or content_type not in VISION_CONTENT_TYPES:
+        print(f"Skipping {url}: status {response.status_code}, type '{content_type}'")
+        return False
+    return True
+
+@retry(
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type(
+        (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+    ),
+    reraise=True
+)
+async def create_completion(
+    client: AsyncOpenAI,
+    limiter: RateLimiter,
+    est_tokens: int,
+    **kwargs
+):
+    """
+    Create a chat completion under the rate limiter.
+    
+    Rate limits, connection errors, timeouts and 5xx errors are retried with
+    exponential backoff and jitter; the OpenAI client's own retries are disabled.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        limiter: Shared rate limiter for the OpenAI account
+        est_tokens: Estimated token cost of the request
+        **kwargs: Arguments for chat.completions.create
+        
+    Returns:
+        Parsed chat completion
+    """
+    await limiter.acquire(est_tokens=est_tokens)
+    try:
+        raw = await client.chat.completions.with_raw_response.create(**kwargs)
+    except RateLimitError as e:
+        limiter.block_for(parse_retry_after(e.response.headers))
+        raise
+    limiter.update(raw.headers)
+    return raw.parse()
+
+async def generate_alt_text_async(
+    client: AsyncOpenAI,
+    sem: asyncio.Semaphore,
+    limiter: RateLimiter,
+    cache: sqlite3.Connection,
+    image_url: str,
+    model: str
+) -> str:
     """
     Generate alt text for an image using OpenAI's Vision API.
     
     Args:
-        client: OpenAI client instance
+        client: AsyncOpenAI client instance
+        sem: Semaphore bounding the number of in-flight requests
+        limiter: Shared rate limiter for the OpenAI account
+        cache: Alt text cache; hits skip the API call entirely
         image_url: URL of the image
         model: OpenAI model to use
         
     Returns:
         Generated alt text
     """
+    cached = cache_get(cache, model, image_url)
+    if cached is not None:
+        return cached
+    
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at writing descriptive, concise alt text for images. "
-                              "Provide only the alt text, without any additional explanation or context."
-                              "If the image is decorative, return 'Decorative image ' with a brief description of the image."
-                              "Be concise. You don't need to write complete sentences. The output should be a single line of text."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Please write appropriate alt text for this image:"},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url,
-                            },
-                        },
-                    ],
-                }
-            ],
-            max_tokens=100  # Limiting tokens for concise alt text
-        )
-        return response.choices[0].message.content.strip()
+        async with sem:
+            response = await create_completion(
+                client,
+                limiter,
+                est_tokens=200,
+                model=model,
+                messages=build_messages(image_url),
+                max_tokens=100  # Limiting tokens for concise alt text
+            )
+        alt_text = response.choices[0].message.content.strip()
+        if alt_text:
+            cache_put(cache, model, image_url, alt_text)
+        return alt_text
     except Exception as e:
         print(f"Error generating alt text: {e}")
         return ""
 
-def main():
+async def generate_alt_text_group(
+    client: AsyncOpenAI,
+    sem: asyncio.Semaphore,
+    limiter: RateLimiter,
+    cache: sqlite3.Connection,
+    items: List[Dict],
+    model: str
+) -> List[str]:
+    """
+    Generate alt text for several images with a single Vision API request.
+    
+    The model is asked for a JSON object mapping each media id to its alt
+    text, so the prompt and request overhead is paid once per group.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        sem: Semaphore bounding the number of in-flight requests
+        limiter: Shared rate limiter for the OpenAI account
+        cache: Alt text cache; hits are left out of the request
+        items: WordPress media items
+        model: OpenAI model to use
+        
+    Returns:
+        Generated alt text for each item, in order ("" on failure)
+    """
+    results = {}
+    pending = []
+    for item in items:
+        cached = cache_get(cache, model, vision_image_url(item))
+        if cached is not None:
+            results[str(item["id"])] = cached
+        else:
+            pending.append(item)
+    
+    if pending:
+        try:
+            async with sem:
+                response = await create_completion(
+                    client,
+                    limiter,
+                    est_tokens=200 * len(pending),
+                    model=model,
+                    messages=build_group_messages(pending),
+                    max_tokens=100 * len(pending),
+                    response_format={"type": "json_object"}
+                )
+            # Key by the digits only, in case the model echoes "Image ID 123"
+            generated = {}
+            for key, value in json.loads(response.choices[0].message.content).items():
+                match = re.search(r"\d+", str(key))
+                if match:
+                    generated[match.group()] = value
+            for item in pending:
+                alt_text = str(generated.get(str(item["id"]), "")).strip()
+                if alt_text:
+                    results[str(item["id"])] = alt_text
+                    cache_put(cache, model, vision_image_url(item), alt_text)
+                else:
+                    print(f"Error generating alt text for image ID {item['id']}: missing from response")
+        except Exception as e:
+            print(f"Error generating alt text: {e}")
+    
+    return [results.get(str(item["id"]), "") for item in items]
+
+async def submit_batch(client: AsyncOpenAI, lines: List[str]) -> str:
+    """
+    Upload JSONL request lines and start a batch job for them.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        lines: JSONL request lines
+        
+    Returns:
+        Batch id
+    """
+    batch_file = await client.files.create(
+        file=("batch_requests.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} with {len(lines)} requests")
+    return batch.id
+
+async def wait_for_batch(
+    client: AsyncOpenAI,
+    batch_id: str,
+    poll_interval: float
+) -> Optional[Dict[str, str]]:
+    """
+    Wait for a batch job to finish and collect its results.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        batch_id: Batch to poll
+        poll_interval: Seconds between batch status checks
+        
+    Returns:
+        Generated alt text keyed by custom_id (failed requests are left out),
+        or None if the batch could not be followed to the end
+    """
+    results = {}
+    try:
+        batch = await client.batches.retrieve(batch_id)
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            if counts:
+                print(f"Batch {batch.id} {batch.status}: {counts.completed}/{counts.total} done")
+        
+        # Successful requests land in the output file, failed ones in the
+        # error file; both use the same line format
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            output = await client.files.content(file_id)
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") != 200:
+                    error = entry.get("error") or (response.get("body") or {}).get("error")
+                    if isinstance(error, dict):
+                        error = error.get("message") or error
+                    print(f"Error generating alt text for image ID {entry['custom_id']}: "
+                          f"{error or response.get('status_code')}")
+                    continue
+                results[entry["custom_id"]] = (
+                    response["body"]["choices"][0]["message"]["content"].strip()
+                )
+        if batch.status != "completed":
+            # e.g. token_limit_exceeded when the organisation's enqueued token
+            # limit is hit; these images are retried on the next run
+            reasons = "; ".join(
+                f"{error.code}: {error.message}"
+                for error in ((batch.errors and batch.errors.data) or [])
+            )
+            print(f"Error: batch {batch.id} ended with status '{batch.status}'"
+                  + (f" ({reasons})" if reasons else ""))
+    except Exception as e:
+        print(f"Error following batch {batch_id}: {e}")
+        return None
+    return results
+
+async def generate_alt_text_batch_api(
+    client: AsyncOpenAI,
+    cache: sqlite3.Connection,
+    items: List[Dict],
+    model: str,
+    poll_interval: float = 30.0
+) -> List[str]:
+    """
+    Generate alt text for many images through OpenAI's Batch API.
+    
+    Batches left running by an interrupted run are collected first. The
+    remaining uncached images are then uploaded as JSONL batch jobs, split
+    to stay under the per-file and enqueued-token limits and submitted one
+    after another. Each job is recorded in BATCH_FILE until its results are
+    cached, so an interrupted run resumes polling instead of resubmitting.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        cache: Alt text cache; hits are not submitted
+        items: WordPress media items
+        model: OpenAI model to use
+        poll_interval: Seconds between batch status checks
+        
+    Returns:
+        Generated alt text for each item, in order ("" on failure)
+    """
+    # The shared client has SDK retries off (create_completion uses tenacity);
+    # the batch calls are not wrapped, so turn them back on here
+    client = client.with_options(max_retries=3)
+    
+    pending = load_pending_batches()
+    
+    async def collect(job: Dict) -> bool:
+        """Wait for a recorded job and cache its results; False if still pending."""
+        job_results = await wait_for_batch(client, job["id"], poll_interval)
+        if job_results is None:
+            return False
+        for custom_id, alt_text in job_results.items():
+            image_url = job["urls"].get(custom_id)
+            if image_url and alt_text:
+                cache_put(cache, job["model"], image_url, alt_text)
+        cache.commit()
+        pending.remove(job)
+        save_pending_batches(pending)
+        return True
+    
+    # Finish batches an interrupted run left behind before submitting anything
+    for job in list(pending):
+        print(f"Resuming batch {job['id']} from a previous run...")
+        await collect(job)
+    
+    # Images still in a batch we couldn't follow are not submitted twice
+    in_flight = {
+        (job["model"], image_url) for job in pending for image_url in job["urls"].values()
+    }
+    
+    results = {}
+    requests_to_send = []  # (custom_id, image_url, JSONL line)
+    for item in items:
+        image_url = vision_image_url(item)
+        cached = cache_get(cache, model, image_url)
+        if cached is not None:
+            results[str(item["id"])] = cached
+            continue
+        if (model, image_url) in in_flight:
+            print(f"Image ID {item['id']} is still in a pending batch; rerun later to collect it")
+            continue
+        requests_to_send.append((str(item["id"]), image_url, json.dumps({
+            "custom_id": str(item["id"]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": build_messages(image_url),
+                "max_tokens": 100
+            }
+        })))
+    
+    # Stay under the Batch API's per-file request count and size limits and
+    # the enqueued token limit
+    max_requests = min(BATCH_MAX_REQUESTS, BATCH_MAX_TOKENS // BATCH_EST_TOKENS)
+    chunks = []
+    chunk, chunk_bytes = [], 0
+    for request in requests_to_send:
+        size = len(request[2].encode("utf-8")) + 1
+        if chunk and (len(chunk) >= max_requests or chunk_bytes + size > BATCH_MAX_BYTES):
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        chunks.append(chunk)
+    
+    # One batch at a time, so only one job's tokens are ever enqueued
+    for chunk in chunks:
+        try:
+            batch_id = await submit_batch(client, [line for _, _, line in chunk])
+        except Exception as e:
+            print(f"Error submitting batch: {e}")
+            break
+        job = {
+            "id": batch_id,
+            "model": model,
+            "urls": {custom_id: image_url for custom_id, image_url, _ in chunk}
+        }
+        pending.append(job)
+        save_pending_batches(pending)
+        if not await collect(job):
+            print(f"Batch {batch_id} is still pending; rerun to collect its results")
+            break
+    
+    for item in items:
+        alt_text = cache_get(cache, model, vision_image_url(item))
+        if alt_text:
+            results[str(item["id"])] = alt_text
+    return [results.get(str(item["id"]), "") for item in items]
+
+async def main():
     """Main execution function."""
+    # Process command line arguments (first, so --help works without a key)
+    (wordpress_url, model, write_mode, limit, output_file, concurrency,
+     batch_mode, group_size) = validate_arguments(sys.argv)
+    
     # Validate environment variables
     if not os.getenv("API_KEY_OPENAI"):
         print("Error: API_KEY_OPENAI not found in .env file")
         sys.exit(1)
-
-    # Process command line arguments
-    wordpress_url, model, write_mode, limit, output_file = validate_arguments(sys.argv)
     
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv("API_KEY_OPENAI"))
+    # Check an existing output file before doing any work; its successful
+    # rows are kept and those images skipped (matched by id only)
+    previous_rows = load_previous_rows(output_file)
+    
+    # Initialize OpenAI client over HTTP/2 so concurrent requests share a connection
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(60.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=32)
+    )
+    client = AsyncOpenAI(
+        api_key=os.getenv("API_KEY_OPENAI"),
+        http_client=http_client,
+        max_retries=0  # Retries are handled by create_completion
+    )
     
     # Fetch media items
     print(f"Fetching media items from {wordpress_url}...")
-    media_items = get_wordpress_media(wordpress_url, limit)
-    
-    # Filter for images missing alt text
+    # Filter for images missing alt text as pages stream in
     images_missing_alt = [
-        item for item in media_items
+        item for item in iter_wordpress_media(wordpress_url, limit)
         if item["media_type"] == "image" and not item.get("alt_text")
     ]
     
     print(f"Found {len(images_missing_alt)} images missing alt text")
     
-    # Prepare CSV output
+    # Resume: skip images a previous run already wrote alt text for
+    done = {int(row[0]) for row in previous_rows}
+    if done:
+        remaining = [item for item in images_missing_alt if item["id"] not in done]
+        print(f"Skipping {len(images_missing_alt) - len(remaining)} images already in {output_file}")
+        images_missing_alt = remaining
+    
+    # Re-uploads share a source_url; describe each file only once
+    items_by_url = {}
+    for item in images_missing_alt:
+        items_by_url.setdefault(item["source_url"], []).append(item)
+    to_generate = [items[0] for items in items_by_url.values()]
+    if len(to_generate) < len(images_missing_alt):
+        print(f"{len(to_generate)} unique image files")
+    
+    cache = open_cache()
+    
+    # Drop missing or unsupported images before paying for a Vision request;
+    # images with cached alt text need no request, so they are not checked
+    to_check = [
+        item for item in to_generate
+        if cache_get(cache, model, vision_image_url(item)) is None
+    ]
+    invalid = []
+    if to_check:
+        with ThreadPoolExecutor(max_workers=min(16, len(to_check))) as executor:
+            valid = list(executor.map(
+                is_valid_image,
+                (vision_image_url(item) for item in to_check)
+            ))
+        invalid = [item for item, ok in zip(to_check, valid) if not ok]
+        invalid_urls = {item["source_url"] for item in invalid}
+        to_generate = [item for item in to_generate if item["source_url"] not in invalid_urls]
+        print(f"{len(to_check) - len(invalid)} of {len(to_check)} uncached images passed the URL check")
+    
+    # Prepare CSV output. Earlier successful rows are rewritten first, without
+    # failed or partial rows, via a temporary file so a crash can't lose them.
     print(f"Writing results to {output_file}")
-    fieldnames = ["id", "title", "original_alt", "generated_alt", "url"]
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDNAMES)
+        writer.writerows(previous_rows)
+    os.replace(tmp_file, output_file)
     
-    with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+    # Rows are written as tuples in CSV_FIELDNAMES order through a 1 MiB buffer
+    with open(output_file, "a", newline="", encoding="utf-8", buffering=1 << 20) as csvfile:
+        writer = csv.writer(csvfile)
+        rows_written = 0
         
-        for item in images_missing_alt:
-            print(f"Processing image ID {item['id']}...")
+        def write_result(source_item: Dict, generated_alt):
+            """Write one row per media item sharing source_item's file."""
+            nonlocal rows_written
+            for item in items_by_url[source_item["source_url"]]:
+                if isinstance(generated_alt, Exception):
+                    print(f"Error generating alt text for image ID {item['id']}: {generated_alt}")
+                    generated_alt = ""
+                
+                writer.writerow((
+                    item["id"],
+                    item["title"]["rendered"],
+                    item.get("alt_text", ""),
+                    generated_alt,
+                    item["source_url"]
+                ))
+                rows_written += 1
+                
+                if write_mode:
+                    # TODO: Implement WordPress update functionality
+                    print("Write mode not yet implemented")
             
-            # Generate alt text
-            generated_alt = generate_alt_text(
-                client,
-                item["source_url"],
-                model
-            )
+            # Checkpoint so a crash loses at most a few rows
+            if rows_written >= CHECKPOINT_ROWS:
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+                cache.commit()
+                rows_written = 0
+        
+        # Images that failed the URL check still get a row so they can be
+        # handled manually
+        for item in invalid:
+            write_result(item, "")
+        
+        if batch_mode:
+            print("Generating alt text with the OpenAI Batch API...")
+            results = await generate_alt_text_batch_api(client, cache, to_generate, model)
+            for item, generated_alt in zip(to_generate, results):
+                write_result(item, generated_alt)
+        else:
+            # Generate alt text concurrently, bounded by the semaphore, and
+            # write each result as soon as it arrives
+            print(f"Generating alt text with up to {concurrency} concurrent requests...")
+            sem = asyncio.Semaphore(concurrency)
+            limiter = RateLimiter()
+            
+            async def process_group(group: List[Dict]):
+                try:
+                    results = await generate_alt_text_group(
+                        client, sem, limiter, cache, group, model
+                    )
+                except Exception as e:
+                    results = [e] * len(group)
+                for item, generated_alt in zip(group, results):
+                    write_result(item, generated_alt)
             
-            # Write to CSV
-            writer.writerow({
-                "id": item["id"],
-                "title": item["title"]["rendered"],
-                "original_alt": item.get("alt_text", ""),
-                "generated_alt": generated_alt,
-                "url": item["source_url"]
-            })
+            async def process_image(item: Dict):
+                try:
+                    generated_alt = await generate_alt_text_async(
+                        client, sem, limiter, cache, vision_image_url(item), model
+                    )
+                except Exception as e:
+                    generated_alt = e
+                write_result(item, generated_alt)
             
-            if write_mode:
-                # TODO: Implement WordPress update functionality
-                print("Write mode not yet implemented")
+            if group_size > 1:
+                tasks = [
+                    process_group(to_generate[i:i + group_size])
+                    for i in range(0, len(to_generate), group_size)
+                ]
+            else:
+                tasks = [process_image(item) for item in to_generate]
+            await asyncio.gather(*tasks)
+    
+    await client.close()
+    cache.commit()
+    cache.close()
     
     print(f"Results written to {output_file}")
+    SESSION.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file